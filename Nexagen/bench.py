@@ -0,0 +1,352 @@
+"""
+Nexagen 基准测试 - 用模拟 LLM 与合成 MCP Agent 驱动生成的运行时
+
+`nexagen bench` 生成一个临时项目，包含 N 个合成的 FastMCP stdio Agent（每个 M 个
+工具），由本地 OpenAI 兼容的模拟服务返回预设的 chat completions，并以多个并发级别
+运行 `agent_pipeline` 与 `nexagen_route`。每次运行在独立进程中进行，报告 tasks/sec、
+任务延迟分位数、追踪文件中各阶段的分位数、MCP 进程启动次数与 RSS 峰值。报告为普通
+JSON，可保存为基线供之后比较。
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .core import env, generate_runtime, schema_agent_cards
+from .discovery import discover_agents
+
+BENCH_REPORT_VERSION = 1
+STUB_MODEL = "nexagen-bench-stub"
+
+_PAIR_RE = re.compile(r"(bench_agent_\d+)/(tool_\d+) 处理 (item-\d+)")
+_TASK_LINE_RE = re.compile(r"^任务: (.*)$", re.MULTILINE)
+_AGENT_LINE_RE = re.compile(r"^Agent: (\S+)$", re.MULTILINE)
+
+
+def scripted_response(prompt: str) -> Dict[str, Any]:
+    """根据任务文本中写明的 agent/工具对回答协调器的提示"""
+    match = _TASK_LINE_RE.search(prompt)
+    pairs = _PAIR_RE.findall(match.group(1)) if match else []
+    if '"steps"' in prompt:
+        return {"steps": [
+            {
+                "task_number": str(i),
+                "task_name": f"step {i}",
+                "task_details": f"调用 {agent}/{tool} 处理 {item}",
+                "depends_on": [],
+                "agent": agent,
+                "tool_name": tool,
+                "tool_args": {"value": item}
+            }
+            for i, (agent, tool, item) in enumerate(pairs, 1)
+        ]}
+    if "将任务拆分成子任务" in prompt:
+        return {"tasks": [
+            {
+                "task_number": str(i),
+                "task_name": f"step {i}",
+                "task_details": f"调用 {agent}/{tool} 处理 {item}",
+                "depends_on": []
+            }
+            for i, (agent, tool, item) in enumerate(pairs, 1)
+        ]}
+    if "选择最合适的Agent" in prompt:
+        return {"agent": pairs[0][0] if pairs else "unknown"}
+    if "为Agent调用生成参数" in prompt or "修复Agent调用参数" in prompt:
+        agent_match = _AGENT_LINE_RE.search(prompt)
+        agent_name = agent_match.group(1) if agent_match else ""
+        for agent, tool, item in pairs:
+            if agent == agent_name:
+                return {"agent": agent, "tool_name": tool, "tool_args": {"value": item}}
+        return {"agent": agent_name, "tool_name": "tool_0", "tool_args": {"value": "item-0"}}
+    return {}
+
+
+class StubLLMServer:
+    """固定延迟的 OpenAI 兼容 /chat/completions 模拟服务，在后台线程中运行"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                messages = body.get("messages") or [{}]
+                prompt = str(messages[-1].get("content", ""))
+                with stub._lock:
+                    stub.requests += 1
+                content = json.dumps(scripted_response(prompt), ensure_ascii=False)
+                if body.get("stream"):
+                    try:
+                        self._stream(content)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # 计划 JSON 完整后客户端即停止读取
+                        self.close_connection = True
+                    return
+                if stub.latency > 0:
+                    time.sleep(stub.latency)
+                data = json.dumps({
+                    "model": STUB_MODEL,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                    "usage": {
+                        "prompt_tokens": len(prompt) // 4,
+                        "completion_tokens": len(content) // 4,
+                        "total_tokens": (len(prompt) + len(content)) // 4
+                    }
+                }, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, text: str):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, content: str, pieces: int = 4):
+                """SSE 响应：第一个增量之前等待一半延迟，其余延迟分摊到各个增量"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                if stub.latency > 0:
+                    time.sleep(stub.latency / 2)
+                size = max(1, -(-len(content) // pieces))
+                for i in range(0, len(content), size):
+                    delta = {"model": STUB_MODEL, "choices": [{"index": 0, "delta": {"content": content[i:i + size]}}]}
+                    self._chunk(f"data: {json.dumps(delta, ensure_ascii=False)}\n\n")
+                    if stub.latency > 0:
+                        time.sleep(stub.latency / 2 / pieces)
+                self._chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="bench-stub-llm", daemon=True)
+
+    def start(self) -> "StubLLMServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_tasks(count: int, agents: int, tools: int, subtasks: int, seed: int = 0) -> List[str]:
+    """合成任务，每个任务写明 subtasks 个随机的 agent/工具对"""
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(count):
+        steps = [
+            f"调用 bench_agent_{rng.randrange(agents)}/tool_{rng.randrange(tools)} 处理 item-{i * subtasks + k}"
+            for k in range(subtasks)
+        ]
+        tasks.append("请依次完成: " + "; ".join(steps))
+    return tasks
+
+
+def prepare_workspace(workdir: Path, agents: int, tools: int, tool_latency: float, base_url: str):
+    """写入合成 Agent 与 mcp.json，发现它们并离线生成运行时"""
+    workdir.mkdir(parents=True, exist_ok=True)
+    (workdir / "agent_cards").mkdir(exist_ok=True)
+    (workdir / "mcp_agents").mkdir(exist_ok=True)
+    (workdir / "bench_agent.py").write_text(env.get_template("bench_agent.py.j2").render(), encoding="utf-8")
+    (workdir / "bench_driver.py").write_text(env.get_template("bench_driver.py.j2").render(), encoding="utf-8")
+    (workdir / "mcp_server.py").write_text(env.get_template("mcp_server.py.j2").render(), encoding="utf-8")
+    (workdir / ".env").write_text(
+        f"API_KEY=bench\nBASE_URL={base_url}\nmodel_name={STUB_MODEL}\n", encoding="utf-8"
+    )
+    servers = {
+        f"bench_agent_{i}": {
+            "command": sys.executable,
+            "args": [
+                str(workdir / "bench_agent.py"),
+                "--name", f"bench_agent_{i}",
+                "--tools", str(tools),
+                "--latency", str(tool_latency)
+            ]
+        }
+        for i in range(agents)
+    }
+    (workdir / "mcp.json").write_text(json.dumps({"mcpServers": servers}, indent=2), encoding="utf-8")
+
+    mcp_cards, report = discover_agents(workdir / "mcp.json")
+    failed = [entry["agent"] for entry in report if not entry["ok"]]
+    if failed:
+        raise RuntimeError(f"Synthetic agents failed to start: {failed}")
+    (workdir / "mcp_agents" / "mcp_cards.json").write_text(
+        json.dumps(mcp_cards, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        schema_agent_cards(workdir, mcp_cards)
+        generate_runtime(workdir)
+
+
+def run_once(workdir: Path, mode: str, concurrency: int, tasks_file: Path, run_env: Dict[str, str]) -> Dict[str, Any]:
+    """在新的驱动进程中运行一个模式/并发组合"""
+    trace_path = workdir / ".nexagen" / f"bench-{mode}-c{concurrency}.jsonl"
+    output = workdir / ".nexagen" / f"bench-{mode}-c{concurrency}.json"
+    trace_path.unlink(missing_ok=True)
+    process = subprocess.run(
+        [
+            sys.executable, "bench_driver.py",
+            "--mode", mode,
+            "--tasks", str(tasks_file),
+            "--concurrency", str(concurrency),
+            "--output", str(output)
+        ],
+        cwd=workdir,
+        env={**run_env, "NEXAGEN_TRACE_PATH": str(trace_path)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    if process.returncode != 0 or not output.exists():
+        raise RuntimeError(f"Benchmark run {mode} c={concurrency} failed:\n{process.stderr[-2000:]}")
+    return json.loads(output.read_text(encoding="utf-8"))
+
+
+def run_bench(
+    agents: int = 4,
+    tools: int = 5,
+    tasks: int = 20,
+    subtasks: int = 2,
+    concurrency: Optional[List[int]] = None,
+    modes: Optional[List[str]] = None,
+    planner: str = "staged",
+    llm_latency: float = 0.2,
+    tool_latency: float = 0.05,
+    port: int = 0,
+    workdir: Optional[Path] = None,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """运行全部基准组合并返回报告"""
+    concurrency = concurrency or [1, 4]
+    modes = modes or ["pipeline", "route"]
+    config = {
+        "agents": agents, "tools": tools, "tasks": tasks, "subtasks": subtasks,
+        "concurrency": concurrency, "modes": modes, "planner": planner,
+        "llm_latency": llm_latency, "tool_latency": tool_latency, "seed": seed
+    }
+    stub = StubLLMServer(port=port, latency=llm_latency).start()
+    tmp = None
+    if workdir is None:
+        tmp = tempfile.TemporaryDirectory(prefix="nexagen-bench-")
+        workdir = Path(tmp.name)
+    workdir = Path(workdir).resolve()
+    try:
+        print(f"Preparing {agents} synthetic agents x {tools} tools in {workdir}")
+        prepare_workspace(workdir, agents, tools, tool_latency, stub.base_url)
+        tasks_file = workdir / "bench_tasks.json"
+        tasks_file.write_text(
+            json.dumps(make_tasks(tasks, agents, tools, subtasks, seed), ensure_ascii=False), encoding="utf-8"
+        )
+        run_env = {
+            **os.environ,
+            "BASE_URL": stub.base_url,
+            "API_KEY": "bench",
+            "model_name": STUB_MODEL,
+            "NEXAGEN_PLANNER": planner,
+            # 每次运行都必须请求 LLM 模拟服务，否则之后的运行全部命中决策缓存
+            "NEXAGEN_DECISION_CACHE": "0",
+            # 计划模板同理：重复的任务结构会跳过规划 LLM 调用
+            "NEXAGEN_PLAN_TEMPLATES": "0",
+            "NEXAGEN_TRACING": "1",
+        }
+        runs = []
+        for mode in modes:
+            for level in concurrency:
+                print(f"  {mode:<8} concurrency={level} ...", flush=True)
+                runs.append(run_once(workdir, mode, level, tasks_file, run_env))
+        return {
+            "version": BENCH_REPORT_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": config,
+            "llm_requests": stub.requests,
+            "runs": runs
+        }
+    finally:
+        stub.stop()
+        if tmp is not None:
+            tmp.cleanup()
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"{'mode':<9} {'conc':>4} {'tasks/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+        f"{'fail':>4} {'llm':>5} {'spawns':>6} {'rss MB':>7}"
+    ]
+    for run in report["runs"]:
+        latency = run["latency_ms"]
+        lines.append(
+            f"{run['mode']:<9} {run['concurrency']:>4} {run['tasks_per_sec']:>8.2f} {latency['p50']:>9.1f} "
+            f"{latency['p95']:>9.1f} {latency['p99']:>9.1f} {run['failed']:>4} {run['llm_calls']:>5} "
+            f"{run['spawns']:>6} {run.get('peak_rss_mb', 0):>7.1f}"
+        )
+    stage_names = sorted({name for run in report["runs"] for name in run["stages"]})
+    if stage_names:
+        lines.append("")
+        lines.append("Per-stage p50 / p95 ms:")
+        for run in report["runs"]:
+            lines.append(f"  {run['mode']} c={run['concurrency']}")
+            for name in stage_names:
+                row = run["stages"].get(name)
+                if row:
+                    lines.append(f"    {name:<40} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f}  (n={row['count']})")
+    return "\n".join(lines)
+
+
+def _delta(current: float, baseline: float) -> str:
+    if not baseline:
+        return "n/a"
+    return f"{(current - baseline) / baseline * 100:+.1f}%"
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> str:
+    """对比两份报告中都存在的运行的吞吐量与延迟差异"""
+    base_runs = {(run["mode"], run["concurrency"]): run for run in baseline.get("runs", [])}
+    lines = []
+    # 只选择了部分模式或并发级别时，两份报告中都有的运行仍可比较
+    ignored = ("modes", "concurrency")
+    base_config = {k: v for k, v in baseline.get("config", {}).items() if k not in ignored}
+    current_config = {k: v for k, v in current.get("config", {}).items() if k not in ignored}
+    if base_config != current_config:
+        lines.append("Warning: benchmark configurations differ, deltas may not be meaningful")
+    lines.append(f"{'mode':<9} {'conc':>4} {'tasks/s':>18} {'p50 ms':>20} {'p95 ms':>20} {'spawns':>10}")
+    for run in current["runs"]:
+        base = base_runs.get((run["mode"], run["concurrency"]))
+        if base is None:
+            continue
+        lines.append(
+            f"{run['mode']:<9} {run['concurrency']:>4} "
+            f"{run['tasks_per_sec']:>8.2f} {_delta(run['tasks_per_sec'], base['tasks_per_sec']):>9} "
+            f"{run['latency_ms']['p50']:>9.1f} {_delta(run['latency_ms']['p50'], base['latency_ms']['p50']):>10} "
+            f"{run['latency_ms']['p95']:>9.1f} {_delta(run['latency_ms']['p95'], base['latency_ms']['p95']):>10} "
+            f"{run['spawns']:>4} ({base['spawns']})"
+        )
+    return "\n".join(lines)
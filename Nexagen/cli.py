@@ -1,6 +1,9 @@
 import click
+import json
 from pathlib import Path
-from .core import create_project, build_project, run_project, magic_wrap_as_mcp
+from .core import create_project, build_project, run_project, replay_project, serve_project, magic_wrap_as_mcp
+from .tracing import load_traces, aggregate, render_prometheus, render_table
+from .bench import run_bench, format_report, compare_reports
 
 @click.group()
 def cli():
@@ -16,19 +19,93 @@ def create(project_name):
     click.echo(f"Project '{project_name}' created successfully at {project_path}")
 
 @cli.command()
-def build():
+@click.option("--concurrency", type=int, default=None, help="Concurrent LLM requests for card generation")
+@click.option("--rpm", type=float, default=None, help="LLM requests-per-minute budget for card generation")
+@click.option("--force", is_flag=True, help="Regenerate every agent card instead of only changed agents")
+@click.option("--discovery-concurrency", type=int, default=None, help="MCP servers probed at once during discovery")
+@click.option("--discovery-timeout", type=float, default=None, help="Per-server connect and listing timeout in seconds")
+@click.option("--cards", type=click.Choice(["llm", "schema"]), default=None,
+              help="Card generation: llm (one LLM call per agent) or schema (straight from tool schemas, offline)")
+@click.option("--describe", is_flag=True, help="With --cards=schema, write agent descriptions with batched LLM calls")
+def build(concurrency, rpm, force, discovery_concurrency, discovery_timeout, cards, describe):
     """Build the Nexagen multi-agent system"""
     project_path = Path.cwd()
-    build_project(project_path)
+    build_project(
+        project_path,
+        concurrency=concurrency,
+        rpm=rpm,
+        force=force,
+        discovery_concurrency=discovery_concurrency,
+        discovery_timeout=discovery_timeout,
+        cards=cards,
+        describe=describe
+    )
     click.echo("Nexagen system built successfully")
 
 @cli.command()
-def run():
+@click.option("--batch", type=click.Path(exists=True, dir_okay=False), default=None,
+              help="Run every task in a JSONL file instead of the demo")
+@click.option("--output", type=click.Path(dir_okay=False), default=None, help="Batch results JSONL (default: stdout)")
+@click.option("--concurrency", type=int, default=None, help="Tasks in flight at once in batch mode")
+@click.option("--planner", type=click.Choice(["staged", "fused"]), default=None, help="Planner mode for batch runs")
+@click.option("--record", type=click.Path(dir_okay=False), default=None,
+              help="Record every LLM and tool call of the batch run to this trace file (.jsonl or .jsonl.gz)")
+def run(batch, output, concurrency, planner, record):
     """Run the Nexagen system"""
+    if record and not batch:
+        raise click.BadParameter("--record requires --batch", param_hint="--record")
     project_path = Path.cwd()
-    run_project(project_path)
+    run_project(
+        project_path,
+        batch=Path(batch).resolve() if batch else None,
+        output=Path(output).resolve() if output else None,
+        concurrency=concurrency,
+        planner=planner,
+        record=Path(record).resolve() if record else None
+    )
     click.echo("Nexagen system running")
 
+@cli.command()
+@click.argument("trace", type=click.Path(exists=True, dir_okay=False))
+@click.option("--latency", type=click.Choice(["recorded", "zero"]), default="recorded",
+              help="Wait for the recorded LLM/tool latencies, or return immediately to profile CPU time")
+@click.option("--concurrency", type=int, default=None, help="Recorded tasks replayed at once (default: 1)")
+@click.option("--output", type=click.Path(dir_okay=False), default=None, help="Per-task comparison JSONL")
+@click.option("--profile", type=click.Path(dir_okay=False), default=None, help="Write cProfile stats to this file")
+@click.option("--top", type=int, default=None, help="Functions printed from the profile (default: 25)")
+def replay(trace, latency, concurrency, output, profile, top):
+    """Re-run recorded tasks against recorded LLM responses and tool results, offline"""
+    project_path = Path.cwd()
+    code = replay_project(
+        project_path,
+        Path(trace).resolve(),
+        latency=latency,
+        concurrency=concurrency,
+        output=Path(output).resolve() if output else None,
+        profile=Path(profile).resolve() if profile else None,
+        top=top
+    )
+    if code:
+        raise SystemExit(code)
+
+@cli.command()
+@click.option("--host", default=None, help="Bind address (default: 127.0.0.1)")
+@click.option("--port", type=int, default=None, help="Port (default: 8000)")
+@click.option("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+@click.option("--worker-concurrency", type=int, default=None, help="Jobs each worker runs at once")
+@click.option("--drain-timeout", type=float, default=None, help="Seconds to wait for running jobs on shutdown")
+def serve(host, port, workers, worker_concurrency, drain_timeout):
+    """Serve agent_pipeline and nexagen_route over HTTP / streamable-HTTP MCP with a worker pool"""
+    project_path = Path.cwd()
+    serve_project(
+        project_path,
+        host=host,
+        port=port,
+        workers=workers,
+        worker_concurrency=worker_concurrency,
+        drain_timeout=drain_timeout
+    )
+
 @cli.command()
 def magic():
     """Wrap the entire multi-agent system as a single MCP agent"""
@@ -37,5 +114,68 @@ def magic():
     click.echo("✨ Nexagen MCP agent created successfully!")
     click.echo("You can now use 'uv run mcp_server.py' to start the MCP server")
 
+@cli.command()
+@click.option("--format", "fmt", type=click.Choice(["table", "prom"]), default="table", help="Output format")
+@click.option("--trace-file", type=click.Path(dir_okay=False), default=None, help="Trace file (default: .nexagen/traces.jsonl)")
+@click.option("--output", type=click.Path(dir_okay=False), default=None, help="Also write a Prometheus text snapshot to this file")
+def stats(fmt, trace_file, output):
+    """Show per-stage latency percentiles from recorded traces"""
+    path = Path(trace_file) if trace_file else Path.cwd() / ".nexagen" / "traces.jsonl"
+    records = load_traces(path)
+    if not records:
+        click.echo(f"No traces found at {path}")
+        return
+    summary = aggregate(records)
+    click.echo(render_prometheus(summary) if fmt == "prom" else render_table(summary))
+    if output:
+        Path(output).write_text(render_prometheus(summary), encoding="utf-8")
+        click.echo(f"Metrics snapshot written to {output}")
+
+@cli.command()
+@click.option("--agents", type=int, default=4, help="Synthetic MCP agents")
+@click.option("--tools", type=int, default=5, help="Tools per agent")
+@click.option("--tasks", type=int, default=20, help="Tasks per run")
+@click.option("--subtasks", type=int, default=2, help="Agent/tool calls per task")
+@click.option("--concurrency", default="1,4", help="Comma-separated concurrency levels")
+@click.option("--mode", default="pipeline,route", help="Comma-separated: pipeline, route")
+@click.option("--planner", type=click.Choice(["staged", "fused"]), default="staged", help="Planner mode")
+@click.option("--llm-latency", type=float, default=0.2, help="Stub LLM latency in seconds")
+@click.option("--tool-latency", type=float, default=0.05, help="Synthetic tool latency in seconds")
+@click.option("--port", type=int, default=0, help="Stub LLM port (0 = any free port)")
+@click.option("--workdir", type=click.Path(file_okay=False), default=None, help="Keep the benchmark project here")
+@click.option("--seed", type=int, default=0, help="Task generator seed")
+@click.option("--save", type=click.Path(dir_okay=False), default=None, help="Save the report as a JSON baseline")
+@click.option("--compare", "compare_to", type=click.Path(exists=True, dir_okay=False), default=None,
+              help="Compare against a saved baseline")
+def bench(agents, tools, tasks, subtasks, concurrency, mode, planner, llm_latency, tool_latency,
+          port, workdir, seed, save, compare_to):
+    """Benchmark the generated runtime offline with a stub LLM and synthetic agents"""
+    modes = [m.strip() for m in mode.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in ("pipeline", "route")]
+    if unknown:
+        raise click.BadParameter(f"unknown mode(s): {', '.join(unknown)}", param_hint="--mode")
+    report = run_bench(
+        agents=agents,
+        tools=tools,
+        tasks=tasks,
+        subtasks=subtasks,
+        concurrency=[int(c) for c in concurrency.split(",") if c.strip()],
+        modes=modes,
+        planner=planner,
+        llm_latency=llm_latency,
+        tool_latency=tool_latency,
+        port=port,
+        workdir=Path(workdir) if workdir else None,
+        seed=seed
+    )
+    click.echo(format_report(report))
+    if compare_to:
+        baseline = json.loads(Path(compare_to).read_text(encoding="utf-8"))
+        click.echo(f"\nCompared with {compare_to}:")
+        click.echo(compare_reports(baseline, report))
+    if save:
+        Path(save).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        click.echo(f"Report saved to {save}")
+
 if __name__ == "__main__":
-    cli()
\ No newline at end of file
+    cli()
@@ -1,4 +1,5 @@
 import json
+import hashlib
 import subprocess
 import asyncio
 import os
@@ -9,10 +10,19 @@ from jinja2 import Environment, FileSystemLoader
 from dotenv import load_dotenv
 from .utils import (
     call_llm,
-    generate_agent_card
+    async_call_llm,
+    generate_agent_card,
+    schema_agent_card,
+    SCHEMA_CARD_VERSION,
+    agent_content_hash,
+    agent_schema_hash,
+    load_build_manifest,
+    save_build_manifest
 )
+from .llm_client import get_client, run_sync
+from .discovery import discover_agents, merge_previous_cards, print_discovery_report
 import time
-from .prompt import generate_agent_cards_prompt
+from .prompt import generate_agent_cards_prompt, generate_agent_descriptions_prompt
 
 # 模板环境设置
 TEMPLATES_DIR = Path(__file__).parent / "templates"
@@ -29,7 +39,415 @@ def create_project(project_path: Path):
     (project_path / ".env").write_text(env_data, encoding='utf-8')
 
 
-def build_project(project_path: Path):
+def generate_agent_cards(project_path: Path, mcp_cards_data: dict, concurrency: int = None, rpm: float = None) -> list:
+    """并发为每个 agent 调用 LLM 生成卡片
+
+    concurrency: 同时进行的 LLM 请求数，默认 NEXAGEN_BUILD_CONCURRENCY（4）
+    rpm: 每分钟请求数上限，默认 NEXAGEN_BUILD_RPM（0 表示不限）
+    单个 agent 失败不影响其他 agent；卡片按 mcp_cards 顺序写入，与完成顺序无关。
+    返回生成的卡片路径（相对项目目录）。
+    """
+    concurrency = max(1, concurrency or int(os.getenv("NEXAGEN_BUILD_CONCURRENCY", "4")))
+    rpm = rpm if rpm is not None else float(os.getenv("NEXAGEN_BUILD_RPM", "0"))
+    client = get_client(max_in_flight=concurrency, rate_per_minute=rpm)
+
+    async def _generate_one(agent_name, agent_data):
+        start = time.perf_counter()
+        try:
+            # 为单个 agent 生成卡片
+            single_agent_data = {agent_name: agent_data}
+            prompt = f"{generate_agent_cards_prompt}\n{json.dumps(single_agent_data, indent=2, ensure_ascii=False)}"
+
+            # 调用 LLM 生成单个 agent 的卡片
+            agent_response = await async_call_llm(prompt, client)
+            agent_info = json.loads(agent_response.replace("```json", "").replace("```", ""))
+
+            # 如果返回的是列表，取第一个元素
+            if isinstance(agent_info, list) and len(agent_info) > 0:
+                agent_info = agent_info[0]
+
+            # 生成 agent card
+            card = generate_agent_card(
+                name=agent_info["name"],
+                description=agent_info["description"],
+                tools=agent_info["skills"],
+                url=agent_info["url"],
+                capabilities=agent_info["capabilities"],
+                default_input_modes=agent_info["defaultInputModes"],
+                default_output_modes=agent_info["defaultOutputModes"]
+            )
+            print(f"  ✓ Generated card for {agent_name}")
+            return agent_name, card, time.perf_counter() - start, None
+        except Exception as e:
+            print(f"  ✗ Error processing agent {agent_name}: {e}")
+            return agent_name, None, time.perf_counter() - start, e
+
+    async def _generate_all():
+        return await asyncio.gather(*[
+            _generate_one(agent_name, agent_data) for agent_name, agent_data in mcp_cards_data.items()
+        ])
+
+    print(f"Processing {len(mcp_cards_data)} agents (concurrency={concurrency}, rpm={rpm or 'unlimited'})")
+    wall_start = time.perf_counter()
+    results = run_sync(_generate_all())
+    wall_time = time.perf_counter() - wall_start
+
+    agent_cards = []
+    for agent_name, card, _, error in results:
+        if card is None:
+            continue
+        card_path = project_path / "agent_cards" / f"{agent_name}.json"
+        card_path.write_text(json.dumps(card, indent=2, ensure_ascii=False), encoding='utf-8')
+        agent_cards.append(str(card_path.relative_to(project_path)))
+
+    failed = [r for r in results if r[3] is not None]
+    print(f"Card generation summary: {len(agent_cards)} ok, {len(failed)} failed, {wall_time:.2f}s wall time")
+    width = max([len(name) for name, _, _, _ in results] + [5])
+    for agent_name, _, latency, error in results:
+        status = "ok" if error is None else f"failed: {error}"
+        print(f"  {agent_name:<{width}}  {latency:7.2f}s  {status}")
+    return agent_cards
+
+
+def schema_agent_cards(project_path: Path, mcp_cards_data: dict, describe: bool = False,
+                       concurrency: int = None, rpm: float = None, batch_size: int = None) -> list:
+    """不经 LLM，直接由 mcp_cards 生成卡片（每个工具对应一个 skill，标签取自工具名与参数名）
+
+    describe=True 时仅 agent 描述交给 LLM，每次请求批量处理 batch_size 个 agent
+    （默认 NEXAGEN_BUILD_DESCRIBE_BATCH，20）；描述生成失败的 agent 仍写入默认描述的
+    卡片，但不计入返回值，下次增量构建时重试。返回生成的卡片路径（相对项目目录）。
+    """
+    start = time.perf_counter()
+    descriptions = {}
+    failed = set()
+    if describe and mcp_cards_data:
+        concurrency = max(1, concurrency or int(os.getenv("NEXAGEN_BUILD_CONCURRENCY", "4")))
+        rpm = rpm if rpm is not None else float(os.getenv("NEXAGEN_BUILD_RPM", "0"))
+        batch_size = max(1, batch_size or int(os.getenv("NEXAGEN_BUILD_DESCRIBE_BATCH", "20")))
+        client = get_client(max_in_flight=concurrency, rate_per_minute=rpm)
+        names = list(mcp_cards_data)
+        batches = [names[i:i + batch_size] for i in range(0, len(names), batch_size)]
+
+        async def _describe(batch):
+            agents = {
+                name: [
+                    {
+                        "name": tool.get("name", ""),
+                        "description": str(tool.get("description") or "").strip().split("\n")[0]
+                    }
+                    for tool in mcp_cards_data[name].get("tools", [])
+                ]
+                for name in batch
+            }
+            prompt = f"{generate_agent_descriptions_prompt}\n{json.dumps(agents, indent=2, ensure_ascii=False)}"
+            try:
+                response = await async_call_llm(prompt, client)
+                result = json.loads(response.replace("```json", "").replace("```", ""))
+                return {name: str(result[name]) for name in batch if isinstance(result, dict) and result.get(name)}
+            except Exception as e:
+                print(f"  ✗ Error describing agents {', '.join(batch)}: {e}")
+                return {}
+
+        async def _describe_all():
+            return await asyncio.gather(*[_describe(batch) for batch in batches])
+
+        print(f"Describing {len(names)} agents in {len(batches)} LLM requests (concurrency={concurrency})")
+        for result in run_sync(_describe_all()):
+            descriptions.update(result)
+        failed = set(names) - set(descriptions)
+
+    agent_cards = []
+    for agent_name, agent_data in mcp_cards_data.items():
+        card = schema_agent_card(agent_name, agent_data, descriptions.get(agent_name))
+        card_path = project_path / "agent_cards" / f"{agent_name}.json"
+        card_path.write_text(json.dumps(card, indent=2, ensure_ascii=False), encoding='utf-8')
+        if agent_name in failed:
+            print(f"  ✗ Generated card for {agent_name} with the default description, retrying next build")
+        else:
+            agent_cards.append(str(card_path.relative_to(project_path)))
+            print(f"  ✓ Generated card for {agent_name}")
+    print(f"Schema card generation: {len(mcp_cards_data)} cards in {time.perf_counter() - start:.2f}s")
+    return agent_cards
+
+
+def card_generator_hash(cards: str = "llm", describe: bool = False) -> str:
+    """卡片生成方式的哈希，写入每个 agent 的内容哈希；切换生成方式或修改提示词后卡片会重新生成"""
+    if cards == "schema":
+        generator = f"schema:{SCHEMA_CARD_VERSION}"
+        if describe:
+            generator += "\0" + generate_agent_descriptions_prompt
+    else:
+        generator = generate_agent_cards_prompt
+    return hashlib.sha256(generator.encode("utf-8")).hexdigest()
+
+
+def incremental_agent_cards(project_path: Path, mcp_cards_data: dict, force: bool = False,
+                            concurrency: int = None, rpm: float = None,
+                            cards: str = "llm", describe: bool = False) -> list:
+    """根据构建清单 mcp_agents/build_manifest.json 增量生成卡片
+
+    每个 agent 的哈希覆盖其 mcp.json 配置与发现的工具/输入 schema。哈希未变且卡片
+    文件存在的 agent 直接复用已有卡片；已从 mcp.json 移除的 agent 会删除其卡片，
+    发现失败的 agent 保留上次的卡片；force=True 时全部重新生成。cards 为 "llm"（逐个 agent 调用 LLM）或 "schema"
+    （直接由工具定义生成，describe=True 时批量调用 LLM 生成描述）。
+    返回当前所有卡片路径（相对项目目录）。
+    """
+    manifest_path = project_path / "mcp_agents" / "build_manifest.json"
+    previous = load_build_manifest(manifest_path).get("agents", {})
+
+    try:
+        servers = json.loads((project_path / "mcp.json").read_text(encoding="utf-8")).get("mcpServers", {})
+    except (OSError, ValueError):
+        servers = {}
+    generator = card_generator_hash(cards, describe)
+
+    hashes = {}
+    to_generate = {}
+    for agent_name, agent_data in mcp_cards_data.items():
+        hashes[agent_name] = agent_content_hash(servers.get(agent_name, {}), agent_data, generator)
+        card_path = project_path / "agent_cards" / f"{agent_name}.json"
+        entry = previous.get(agent_name)
+        if force or not entry or entry.get("hash") != hashes[agent_name] or not card_path.exists():
+            to_generate[agent_name] = agent_data
+        else:
+            print(f"  = Reusing card for {agent_name} (unchanged)")
+
+    # 仍在 mcp.json 中但本次发现失败的 agent 保留上次的卡片与清单条目，下次构建时再更新
+    kept = {
+        agent_name: entry for agent_name, entry in previous.items()
+        if agent_name in servers and agent_name not in mcp_cards_data
+        and (project_path / "agent_cards" / f"{agent_name}.json").exists()
+    }
+    for agent_name in kept:
+        print(f"  ~ Keeping previous card for {agent_name} (discovery failed)")
+
+    # 清理已从 mcp.json 移除的 agent 的卡片
+    for agent_name in set(previous) - set(servers) - set(mcp_cards_data):
+        card_path = project_path / "agent_cards" / f"{agent_name}.json"
+        if card_path.exists():
+            card_path.unlink()
+            print(f"  - Pruned card for removed agent {agent_name}")
+
+    if to_generate:
+        if cards == "schema":
+            generated = schema_agent_cards(
+                project_path, to_generate, describe=describe, concurrency=concurrency, rpm=rpm
+            )
+        else:
+            generated = generate_agent_cards(project_path, to_generate, concurrency=concurrency, rpm=rpm)
+    else:
+        generated = []
+        print("All agent cards are up to date")
+    generated_names = {Path(path).stem for path in generated}
+
+    agents = {}
+    agent_cards = []
+    for agent_name in mcp_cards_data:
+        if agent_name in to_generate and agent_name not in generated_names:
+            # 生成失败的 agent 不写入清单，下次构建时重试
+            continue
+        agents[agent_name] = {
+            "hash": hashes[agent_name],
+            "schema_hash": agent_schema_hash(servers.get(agent_name, {}), mcp_cards_data[agent_name]),
+            "card": f"agent_cards/{agent_name}.json"
+        }
+        agent_cards.append(str(Path("agent_cards") / f"{agent_name}.json"))
+    for agent_name, entry in kept.items():
+        agents[agent_name] = entry
+        agent_cards.append(str(Path("agent_cards") / f"{agent_name}.json"))
+    save_build_manifest(manifest_path, {"agents": agents})
+    print(f"Agent cards: {len(generated)} generated, {len(agent_cards) - len(generated)} reused")
+    return agent_cards
+
+
+def generate_runtime(project_path: Path):
+    """生成项目运行时模块（调度 Agent、LLM 客户端、目录、索引、缓存、MCP 客户端、执行器、pipeline、调度器）"""
+    # 3. 生成调度Agent
+    try:
+        print("Generating orchestrator agent...")
+
+        #orchestrator_template = env.get_template("orchestrator_agent.py.j2")
+        #rendered_content = orchestrator_template.render()
+        (project_path / "orchestrator_agent.py").write_text((TEMPLATES_DIR/"orchestrator_agent.py.j2").read_text(encoding='utf-8'), encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering orchestrator template: {e}")
+        #traceback.print_exc()
+        #raise
+
+    # 复制共享的 LLM 客户端
+    try:
+        print("Generating LLM client...")
+        (project_path / "llm_client.py").write_text((Path(__file__).parent / "llm_client.py").read_text(encoding='utf-8'), encoding='utf-8')
+    except Exception as e:
+        print(f"Error copying LLM client: {e}")
+
+    # 复制共享的追踪模块
+    try:
+        print("Generating tracing...")
+        (project_path / "tracing.py").write_text((Path(__file__).parent / "tracing.py").read_text(encoding='utf-8'), encoding='utf-8')
+    except Exception as e:
+        print(f"Error copying tracing: {e}")
+
+    # 复制共享的日志配置
+    try:
+        print("Generating log setup...")
+        (project_path / "log_setup.py").write_text((Path(__file__).parent / "log_setup.py").read_text(encoding='utf-8'), encoding='utf-8')
+    except Exception as e:
+        print(f"Error copying log setup: {e}")
+
+    # 生成工具参数校验模块（目录快照构建时用它预编译 input_schema）
+    try:
+        print("Generating tool validator...")
+        validator_template = env.get_template("tool_validator.py.j2")
+        rendered_content = validator_template.render()
+        (project_path / "tool_validator.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering tool validator template: {e}")
+
+    # 生成 Agent 目录模块及预编译快照（运行时一次读取即可加载全部卡片）
+    try:
+        print("Generating agent catalog...")
+        catalog_template = env.get_template("agent_catalog.py.j2")
+        rendered_content = catalog_template.render()
+        (project_path / "agent_catalog.py").write_text(rendered_content, encoding='utf-8')
+        subprocess.run([sys.executable, "agent_catalog.py"], cwd=project_path)
+    except Exception as e:
+        print(f"Error building agent catalog: {e}")
+
+    # 生成本地检索索引
+    try:
+        print("Generating agent index...")
+        index_template = env.get_template("agent_index.py.j2")
+        rendered_content = index_template.render()
+        (project_path / "agent_index.py").write_text(rendered_content, encoding='utf-8')
+        subprocess.run([sys.executable, "agent_index.py"], cwd=project_path)
+    except Exception as e:
+        print(f"Error building agent index: {e}")
+
+    # 生成决策缓存模块
+    try:
+        print("Generating decision cache...")
+        cache_template = env.get_template("decision_cache.py.j2")
+        rendered_content = cache_template.render()
+        (project_path / "decision_cache.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering decision cache template: {e}")
+
+    # 生成计划模板缓存模块
+    try:
+        print("Generating plan cache...")
+        plan_cache_template = env.get_template("plan_cache.py.j2")
+        rendered_content = plan_cache_template.render()
+        (project_path / "plan_cache.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering plan cache template: {e}")
+
+    # 生成工具结果缓存模块
+    try:
+        print("Generating result cache...")
+        result_cache_template = env.get_template("result_cache.py.j2")
+        rendered_content = result_cache_template.render()
+        (project_path / "result_cache.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering result cache template: {e}")
+
+    # 生成工具结果处理模块
+    try:
+        print("Generating result store...")
+        result_store_template = env.get_template("result_store.py.j2")
+        rendered_content = result_store_template.render()
+        (project_path / "result_store.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering result store template: {e}")
+
+    # 生成 Agent 健康状态与熔断模块
+    try:
+        print("Generating agent health...")
+        agent_health_template = env.get_template("agent_health.py.j2")
+        rendered_content = agent_health_template.render()
+        (project_path / "agent_health.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering agent health template: {e}")
+
+    # 生成 LLM / 工具调用录制与回放模块
+    try:
+        print("Generating recording...")
+        recording_template = env.get_template("recording.py.j2")
+        rendered_content = recording_template.render()
+        (project_path / "recording.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering recording template: {e}")
+
+    # 4. 生成MCP客户端
+    try:
+        print("Generating MCP client...")
+        mcp_client_template = env.get_template("mcp_client.py.j2")
+        rendered_content = mcp_client_template.render()
+        (project_path / "mcp_client.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering MCP client template: {e}")
+        #traceback.print_exc()
+        #raise
+
+    # 5. 生成Agent执行器
+    try:
+        print("Generating agent executor...")
+        executor_template = env.get_template("agent_executor.py.j2")
+        rendered_content = executor_template.render()
+        (project_path / "agent_executor.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering agent executor template: {e}")
+        #traceback.print_exc()
+        #raise
+    #print()
+    # 6. 生成Agent pipeline
+    try:
+        print("Generating Agent pipeline...")
+        pipeline_template = env.get_template("pipeline.py.j2")
+        rendered_content = pipeline_template.render()
+        (project_path / "pipeline.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering pipeline template: {e}")
+        # traceback.print_exc()
+        # raise
+    # 生成子任务调度器
+    try:
+        print("Generating task scheduler...")
+        scheduler_template = env.get_template("task_scheduler.py.j2")
+        rendered_content = scheduler_template.render()
+        (project_path / "task_scheduler.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering task scheduler template: {e}")
+
+    # 生成多进程服务入口（nexagen serve）
+    try:
+        print("Generating server...")
+        serve_template = env.get_template("serve.py.j2")
+        rendered_content = serve_template.render()
+        (project_path / "serve.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering server template: {e}")
+
+    # 生成回放驱动（nexagen replay）
+    try:
+        print("Generating replay driver...")
+        replay_template = env.get_template("replay.py.j2")
+        rendered_content = replay_template.render()
+        (project_path / "replay.py").write_text(rendered_content, encoding='utf-8')
+    except Exception as e:
+        print(f"Error rendering replay template: {e}")
+
+
+def build_project(
+    project_path: Path,
+    concurrency: int = None,
+    rpm: float = None,
+    force: bool = False,
+    discovery_concurrency: int = None,
+    discovery_timeout: float = None,
+    cards: str = None,
+    describe: bool = False
+):
     """Build the Nexagen system"""
     try:
         print("Starting Nexagen system build...")
@@ -40,116 +458,38 @@ def build_project(project_path: Path):
         subprocess.run(["uv", "pip", "install", "a2a-sdk", "mcp", "uvicorn", "httpx", "jinja2", "python-dotenv"])
 
         try:
-            #生成auto_find_mcp_agents
+            # 并发探测 mcp.json 中的所有 server，生成 mcp_cards
+            print("Discovering MCP agents...")
+            mcp_cards_data, discovery_report = discover_agents(
+                project_path / "mcp.json", concurrency=discovery_concurrency, timeout=discovery_timeout
+            )
+            # 发现失败的 server 沿用上次的条目，避免一次探测失败就从 mcp_cards.json 中消失
+            mcp_cards_path = project_path / "mcp_agents" / "mcp_cards.json"
             try:
-                print("Generating agent executor...")
-                executor_template = env.get_template("auto_find_mcp_agents.py.j2")
-                rendered_content = executor_template.render()
-                (project_path / "auto_find_mcp_agents.py").write_text(rendered_content, encoding='utf-8')
-            except Exception as e:
-                print(f"Error rendering auto_find_mcp_agents template: {e}")
-                #traceback.print_exc()
-                #raise
-            #执行auto_find_mcp_agents
-            os.system("python auto_find_mcp_agents.py")
-            os.remove("auto_find_mcp_agents.py")
+                previous_cards = json.loads(mcp_cards_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                previous_cards = {}
+            mcp_cards_data = merge_previous_cards(mcp_cards_data, discovery_report, previous_cards)
+            print_discovery_report(discovery_report)
+            (project_path / "mcp_agents").mkdir(exist_ok=True)
+            mcp_cards_path.write_text(
+                json.dumps(mcp_cards_data, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
             # 2. 生成智能体卡片
             print("Generating agent cards...")
 
             (project_path / "agent_cards").mkdir(exist_ok=True)
-            agent_cards = []
-
-            # 读取 mcp_cards
-            with open(f"{project_path}/mcp_agents/mcp_cards.json", encoding="utf-8") as fh:
-                mcp_cards_data = json.load(fh)
-
-            # 分批处理每个 agent，避免一次性发送太多数据导致超时
-            for agent_name, agent_data in mcp_cards_data.items():
-                try:
-                    print(f"Processing agent: {agent_name}")
-                    
-                    # 为单个 agent 生成卡片
-                    single_agent_data = {agent_name: agent_data}
-                    prompt = f"{generate_agent_cards_prompt}\n{json.dumps(single_agent_data, indent=2, ensure_ascii=False)}"
-                    
-                    # 调用 LLM 生成单个 agent 的卡片
-                    agent_response = call_llm(prompt)
-                    agent_info = json.loads(agent_response.replace("```json", "").replace("```", ""))
-                    
-                    # 如果返回的是列表，取第一个元素
-                    if isinstance(agent_info, list) and len(agent_info) > 0:
-                        agent_info = agent_info[0]
-                    
-                    # 生成 agent card
-                    card = generate_agent_card(
-                        name=agent_info["name"],
-                        description=agent_info["description"],
-                        tools=agent_info["skills"],
-                        url=agent_info["url"],
-                        capabilities=agent_info["capabilities"],
-                        default_input_modes=agent_info["defaultInputModes"],
-                        default_output_modes=agent_info["defaultOutputModes"]
-                    )
-
-                    card_path = project_path / "agent_cards" / f"{agent_name}.json"
-                    card_path.write_text(json.dumps(card, indent=2, ensure_ascii=False), encoding='utf-8')
-                    agent_cards.append(str(card_path.relative_to(project_path)))
-                    
-                    print(f"  ✓ Generated card for {agent_name}")
-                    
-                    # 添加延迟避免 API 限流
-                    time.sleep(0.5)
-                    
-                except Exception as e:
-                    print(f"  ✗ Error processing agent {agent_name}: {e}")
-                    print(f"    Skipping {agent_name}...")
-                    continue
+
+            # 增量构建：只为内容哈希变化的 agent 重新生成卡片
+            cards = cards or os.getenv("NEXAGEN_BUILD_CARDS", "llm")
+            agent_cards = incremental_agent_cards(
+                project_path, mcp_cards_data, force=force, concurrency=concurrency, rpm=rpm,
+                cards=cards, describe=describe
+            )
             
             print(f"Build agent cards ok. Generated {len(agent_cards)} cards.")
-            # 3. 生成调度Agent
-            try:
-                print("Generating orchestrator agent...")
-
-                #orchestrator_template = env.get_template("orchestrator_agent.py.j2")
-                #rendered_content = orchestrator_template.render()
-                (project_path / "orchestrator_agent.py").write_text((TEMPLATES_DIR/"orchestrator_agent.py.j2").read_text(encoding='utf-8'), encoding='utf-8')
-            except Exception as e:
-                print(f"Error rendering orchestrator template: {e}")
-                #traceback.print_exc()
-                #raise
-
-            # 4. 生成MCP客户端
-            try:
-                print("Generating MCP client...")
-                mcp_client_template = env.get_template("mcp_client.py.j2")
-                rendered_content = mcp_client_template.render()
-                (project_path / "mcp_client.py").write_text(rendered_content, encoding='utf-8')
-            except Exception as e:
-                print(f"Error rendering MCP client template: {e}")
-                #traceback.print_exc()
-                #raise
-
-            # 5. 生成Agent执行器
-            try:
-                print("Generating agent executor...")
-                executor_template = env.get_template("agent_executor.py.j2")
-                rendered_content = executor_template.render()
-                (project_path / "agent_executor.py").write_text(rendered_content, encoding='utf-8')
-            except Exception as e:
-                print(f"Error rendering agent executor template: {e}")
-                #traceback.print_exc()
-                #raise
-            #print()
-            # 6. 生成Agent pipeline
-            try:
-                print("Generating Agent pipeline...")
-                pipeline_template = env.get_template("pipeline.py.j2")
-                rendered_content = pipeline_template.render()
-                (project_path / "pipeline.py").write_text(rendered_content, encoding='utf-8')
-            except Exception as e:
-                print(f"Error rendering pipeline template: {e}")
-                # traceback.print_exc()
-                # raise
+            # 3-6. 生成运行时模块
+            generate_runtime(project_path)
             #print()
             # 7. 生成Demo
             try:
@@ -171,10 +511,35 @@ def build_project(project_path: Path):
         #sys.exit(1)
 
 
-def run_project(project_path: Path):
-    """Run the Nexagen system"""
+# 缓存命中时不会发出 LLM / 工具调用，录制时关闭，保证录制文件覆盖整次运行
+RECORD_ENV = {"NEXAGEN_DECISION_CACHE": "0", "NEXAGEN_PLAN_TEMPLATES": "0", "NEXAGEN_RESULT_CACHE": "0"}
+
+
+def run_project(project_path: Path, batch: Path = None, output: Path = None,
+                concurrency: int = None, planner: str = None, record: Path = None):
+    """Run the Nexagen system
+
+    batch: 任务 JSONL 文件，指定时通过 pipeline.py 批量执行，结果写入 output（默认 stdout）
+    record: 录制文件，批量执行期间的 LLM 与工具调用写入其中，供 `nexagen replay` 回放
+    """
     try:
         print("Starting Nexagen system...")
+        if batch is not None:
+            command = ["python", "pipeline.py", "--batch", str(batch)]
+            if output is not None:
+                command += ["--output", str(output)]
+            if concurrency is not None:
+                command += ["--concurrency", str(concurrency)]
+            if planner is not None:
+                command += ["--planner", planner]
+            run_env = None
+            if record is not None:
+                run_env = {**os.environ, **RECORD_ENV, "NEXAGEN_RECORD": str(record)}
+                run_env.pop("NEXAGEN_REPLAY", None)
+            subprocess.run(command, cwd=project_path, env=run_env)
+            if record is not None:
+                print(f"LLM and tool calls recorded to {record}")
+            return
         try:
             # 1. 运行A2A客户端
             print("Starting Nexagen client...")
@@ -188,6 +553,61 @@ def run_project(project_path: Path):
         #sys.exit(1)
 
 
+def replay_project(project_path: Path, trace: Path, latency: str = "recorded", concurrency: int = None,
+                   output: Path = None, profile: Path = None, top: int = None) -> int:
+    """用录制文件重新执行录制的任务（replay.py），返回进程退出码
+
+    不访问网络与 MCP Agent；结果有变化或存在未录制的调用时退出码为 1。
+    """
+    if not (project_path / "replay.py").exists():
+        print("replay.py not found. Please run 'nexagen build' first.")
+        return 1
+    command = [sys.executable, "replay.py", str(trace), "--latency", latency]
+    if concurrency is not None:
+        command += ["--concurrency", str(concurrency)]
+    if output is not None:
+        command += ["--output", str(output)]
+    if profile is not None:
+        command += ["--profile", str(profile)]
+    if top is not None:
+        command += ["--top", str(top)]
+    replay_env = {k: v for k, v in os.environ.items() if k not in ("NEXAGEN_RECORD", "NEXAGEN_REPLAY")}
+    return subprocess.run(command, cwd=project_path, env=replay_env).returncode
+
+
+def serve_project(project_path: Path, host: str = None, port: int = None, workers: int = None,
+                  worker_concurrency: int = None, drain_timeout: float = None):
+    """以多进程 HTTP / streamable-HTTP MCP 服务运行系统（serve.py）
+
+    nexagen_route 由 worker 进程中的 mcp_server.py 执行，尚未执行 `nexagen magic` 时在此生成。
+    """
+    try:
+        if not (project_path / "serve.py").exists():
+            print("serve.py not found. Please run 'nexagen build' first.")
+            return
+        if not (project_path / "mcp_server.py").exists():
+            print("Generating MCP server...")
+            mcp_server_template = env.get_template("mcp_server.py.j2")
+            (project_path / "mcp_server.py").write_text(mcp_server_template.render(), encoding='utf-8')
+        command = [sys.executable, "serve.py"]
+        if host is not None:
+            command += ["--host", host]
+        if port is not None:
+            command += ["--port", str(port)]
+        if workers is not None:
+            command += ["--workers", str(workers)]
+        if worker_concurrency is not None:
+            command += ["--worker-concurrency", str(worker_concurrency)]
+        if drain_timeout is not None:
+            command += ["--drain-timeout", str(drain_timeout)]
+        subprocess.run(command, cwd=project_path)
+    except KeyboardInterrupt:
+        # 服务进程自行处理 Ctrl-C 并排空任务
+        pass
+    except Exception as e:
+        print(f"Serve failed: {e}")
+
+
 def magic_wrap_as_mcp(project_path: Path):
     """将整个多智能体系统封装为单个 MCP Agent"""
     try:
@@ -0,0 +1,167 @@
+"""
+Nexagen Agent 发现 - 探测 mcp.json 中每个 MCP server 的工具、提示词与资源
+"""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import anyio
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+
+async def probe_server(agent_name: str, server_config: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """连接一个 server，列出其能力后立即关闭会话"""
+    server_params = StdioServerParameters(
+        command=server_config["command"],
+        args=server_config.get("args", []),
+        env=server_config.get("env")
+    )
+    with anyio.fail_after(timeout):
+        async with stdio_client(server_params) as (read, write):
+            async with ClientSession(read, write) as session:
+                init = await session.initialize()
+                capabilities = init.capabilities
+
+                response = await session.list_tools()
+                tools = []
+                for tool in response.tools:
+                    tool_info = {
+                        "name": tool.name,
+                        "description": tool.description,
+                        "input_schema": tool.inputSchema
+                    }
+                    # 工具注解（readOnlyHint、openWorldHint 等）决定运行时的工具结果缓存
+                    annotations = getattr(tool, "annotations", None)
+                    if annotations is not None:
+                        tool_info["annotations"] = annotations.model_dump(exclude_none=True)
+                    tools.append(tool_info)
+                info = {"tools": tools}
+                # 只记录非空的提示词 / 资源，只提供工具的 server 的卡片保持不变
+                if capabilities.prompts:
+                    response = await session.list_prompts()
+                    prompts = [
+                        {
+                            "name": prompt.name,
+                            "description": prompt.description,
+                            "arguments": [
+                                {
+                                    "name": argument.name,
+                                    "description": argument.description,
+                                    "required": argument.required
+                                } for argument in (prompt.arguments or [])
+                            ]
+                        } for prompt in response.prompts
+                    ]
+                    if prompts:
+                        info["prompts"] = prompts
+                if capabilities.resources:
+                    response = await session.list_resources()
+                    resources = [
+                        {
+                            "uri": str(resource.uri),
+                            "name": resource.name,
+                            "description": resource.description,
+                            "mimeType": resource.mimeType
+                        } for resource in response.resources
+                    ]
+                    if resources:
+                        info["resources"] = resources
+                return info
+
+
+async def discover_agents_async(
+    servers: Dict[str, Dict[str, Any]],
+    concurrency: int = 8,
+    timeout: float = 30.0
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """并发探测各 server；按 mcp.json 顺序返回 (mcp_cards, report)"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _probe(agent_name, server_config):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                info = await probe_server(agent_name, server_config, timeout)
+                return agent_name, info, time.perf_counter() - start, None
+            except TimeoutError:
+                return agent_name, None, time.perf_counter() - start, f"timed out after {timeout:g}s"
+            except Exception as e:
+                return agent_name, None, time.perf_counter() - start, str(e) or type(e).__name__
+
+    results = await asyncio.gather(*[_probe(name, config) for name, config in servers.items()])
+
+    mcp_cards = {}
+    report = []
+    for agent_name, info, latency, error in results:
+        if info is not None:
+            mcp_cards[agent_name] = info
+        report.append({
+            "agent": agent_name,
+            "ok": info is not None,
+            "latency": latency,
+            "error": error,
+            "tools": len(info.get("tools", [])) if info else 0,
+            "prompts": len(info.get("prompts", [])) if info else 0,
+            "resources": len(info.get("resources", [])) if info else 0
+        })
+    return mcp_cards, report
+
+
+def discover_agents(
+    mcp_json_path: Path,
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """发现 mcp.json 中的所有 server
+
+    concurrency: 同时探测的 server 数，默认 NEXAGEN_DISCOVERY_CONCURRENCY（8）
+    timeout: 每个 server 连接与列举的超时秒数，默认 NEXAGEN_DISCOVERY_TIMEOUT（30）
+    """
+    concurrency = concurrency or int(os.getenv("NEXAGEN_DISCOVERY_CONCURRENCY", "8"))
+    timeout = timeout or float(os.getenv("NEXAGEN_DISCOVERY_TIMEOUT", "30"))
+    with open(mcp_json_path, "r", encoding="utf-8") as fh:
+        servers = json.load(fh).get("mcpServers", {})
+    return asyncio.run(discover_agents_async(servers, concurrency=concurrency, timeout=timeout))
+
+
+def merge_previous_cards(
+    mcp_cards: Dict[str, Any],
+    report: List[Dict[str, Any]],
+    previous: Dict[str, Any]
+) -> Dict[str, Any]:
+    """本次发现失败的 server 沿用上次 mcp_cards.json 中的条目（按 mcp.json 顺序）
+
+    沿用的条目在 report 中标记 kept=True；上次也没有条目的 server 仍然缺失。
+    """
+    merged = {}
+    for entry in report:
+        agent_name = entry["agent"]
+        if agent_name in mcp_cards:
+            merged[agent_name] = mcp_cards[agent_name]
+        elif agent_name in previous:
+            merged[agent_name] = previous[agent_name]
+            entry["kept"] = True
+    return merged
+
+
+def print_discovery_report(report: List[Dict[str, Any]]):
+    """打印每个 server 的发现耗时与失败原因"""
+    ok = sum(1 for entry in report if entry["ok"])
+    kept = sum(1 for entry in report if entry.get("kept"))
+    summary = f"Discovery summary: {ok} ok, {len(report) - ok} failed"
+    if kept:
+        summary += f" ({kept} kept from the previous build)"
+    print(summary)
+    width = max([len(entry["agent"]) for entry in report] + [5])
+    for entry in report:
+        if entry["ok"]:
+            status = f"{entry['tools']} tools, {entry['prompts']} prompts, {entry['resources']} resources"
+        else:
+            status = f"failed: {entry['error']}"
+            if entry.get("kept"):
+                status += " (kept previous entry)"
+        print(f"  {entry['agent']:<{width}}  {entry['latency']:7.2f}s  {status}")
@@ -0,0 +1,389 @@
+"""
+Nexagen LLM 客户端 - 带连接池与限流的 OpenAI 兼容 chat completions 客户端
+
+本模块只依赖 httpx 与标准库。`nexagen build` 生成卡片时使用它，并将其原样复制到
+生成的项目中，由协调器用于所有 LLM 调用。
+"""
+import asyncio
+import atexit
+import contextvars
+import email.utils
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+class LLMError(Exception):
+    """LLM 请求重试耗尽，或返回了不可重试的状态码"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """线程安全的令牌桶，由使用该客户端的所有事件循环共享"""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """取出一个令牌，返回调用方使用前需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """把 Retry-After 头（秒数或 HTTP 日期）解析为秒数"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """共享的 chat completions 客户端
+
+    - 每个事件循环一个带连接池、保持长连接的 httpx.AsyncClient（可选 HTTP/2）
+    - 每个事件循环最多 max_in_flight 个并发请求
+    - 可选的每分钟请求数令牌桶，在所有事件循环与线程间共享
+    - 传输错误、429 与 5xx 按带抖动的指数退避重试，服务器返回 Retry-After 时按其等待
+
+    异步代码使用 achat / acomplete 协程，同步代码使用 chat / complete。同步接口在后台
+    事件循环中发送请求，调用之间复用连接。
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        max_in_flight: Optional[int] = None,
+        rate_per_minute: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        timeout: Optional[float] = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        http2: Optional[bool] = None,
+    ):
+        self.base_url = (base_url or os.getenv("BASE_URL") or "").rstrip("/")
+        self.api_key = api_key if api_key is not None else os.getenv("API_KEY")
+        self.model = model or os.getenv("model_name")
+        self.max_in_flight = max_in_flight or int(_env_float("NEXAGEN_LLM_MAX_IN_FLIGHT", 8))
+        rpm = rate_per_minute if rate_per_minute is not None else _env_float("NEXAGEN_LLM_RPM", 0)
+        self.rate_limiter = TokenBucket(rpm) if rpm > 0 else None
+        self.max_attempts = max_attempts or int(_env_float("NEXAGEN_LLM_MAX_ATTEMPTS", 3))
+        self.timeout = timeout or _env_float("NEXAGEN_LLM_TIMEOUT", 60)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        if http2 is None:
+            http2 = os.getenv("NEXAGEN_LLM_HTTP2", "").lower() in ("1", "true", "yes")
+        self.http2 = http2 and self._h2_available()
+        self._loop_state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _h2_available() -> bool:
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+            return False
+
+    def _state(self) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        state = self._loop_state.get(loop)
+        if state is None:
+            limits = httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight,
+            )
+            state = {
+                "http": httpx.AsyncClient(
+                    headers={
+                        "Authorization": f"Bearer {self.api_key}",
+                        "Content-Type": "application/json",
+                    },
+                    timeout=self.timeout,
+                    limits=limits,
+                    http2=self.http2,
+                ),
+                "semaphore": asyncio.Semaphore(self.max_in_flight),
+            }
+            self._loop_state[loop] = state
+        return state
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def achat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.1,
+        max_tokens: int = 4000,
+        json_mode: bool = False,
+        timeout: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        **extra: Any,
+    ) -> Dict[str, Any]:
+        """发送 chat completion 请求，返回解码后的响应体"""
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
+        payload.update(extra)
+
+        state = self._state()
+        attempts = max_attempts or self.max_attempts
+        for attempt in range(attempts):
+            retry_after = None
+            try:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire()
+                async with state["semaphore"]:
+                    response = await state["http"].post(
+                        f"{self.base_url}/chat/completions",
+                        json=payload,
+                        timeout=timeout or self.timeout,
+                    )
+                if response.status_code in RETRY_STATUS_CODES:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    raise LLMError(f"LLM API returned {response.status_code}", response.status_code)
+                if response.status_code >= 400:
+                    # 其余 4xx 重试也不会成功
+                    raise LLMError(
+                        f"LLM API returned {response.status_code}: {response.text[:200]}",
+                        response.status_code,
+                    )
+                return response.json()
+            except LLMError as e:
+                if e.status_code not in RETRY_STATUS_CODES or attempt == attempts - 1:
+                    raise
+                error = e
+            except (httpx.TransportError, ValueError) as e:
+                if attempt == attempts - 1:
+                    raise LLMError(f"LLM API request failed: {e}") from e
+                error = e
+            delay = self._backoff(attempt, retry_after)
+            logger.warning(f"LLM API call failed (attempt {attempt + 1}/{attempts}): {error}; retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        raise LLMError("LLM API request failed")
+
+    async def astream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.1,
+        max_tokens: int = 4000,
+        json_mode: bool = False,
+        timeout: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        **extra: Any,
+    ) -> AsyncIterator[str]:
+        """以流式方式请求 chat completion，按到达顺序产出内容增量
+
+        失败的请求与 achat 一样重试，但只在收到第一个增量之前重试。忽略 "stream"、直接
+        返回 JSON 的服务器一次性产出全部内容。提前关闭生成器（aclose）会关闭响应。
+        """
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
+        payload.update(extra)
+
+        state = self._state()
+        attempts = max_attempts or self.max_attempts
+        started = False
+        for attempt in range(attempts):
+            retry_after = None
+            try:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire()
+                async with state["semaphore"]:
+                    request = state["http"].build_request(
+                        "POST",
+                        f"{self.base_url}/chat/completions",
+                        json=payload,
+                        timeout=timeout or self.timeout,
+                    )
+                    response = await state["http"].send(request, stream=True)
+                    try:
+                        if response.status_code in RETRY_STATUS_CODES:
+                            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                            raise LLMError(f"LLM API returned {response.status_code}", response.status_code)
+                        if response.status_code >= 400:
+                            text = (await response.aread()).decode("utf-8", "replace")
+                            raise LLMError(f"LLM API returned {response.status_code}: {text[:200]}", response.status_code)
+                        if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                            body = json.loads(await response.aread())
+                            started = True
+                            yield body["choices"][0]["message"]["content"]
+                            return
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                return
+                            for choice in json.loads(data).get("choices") or []:
+                                delta = (choice.get("delta") or {}).get("content")
+                                if delta:
+                                    started = True
+                                    yield delta
+                        return
+                    finally:
+                        await response.aclose()
+            except LLMError as e:
+                if started or e.status_code not in RETRY_STATUS_CODES or attempt == attempts - 1:
+                    raise
+                error = e
+            except (httpx.TransportError, ValueError) as e:
+                if started or attempt == attempts - 1:
+                    raise LLMError(f"LLM API stream failed: {e}") from e
+                error = e
+            delay = self._backoff(attempt, retry_after)
+            logger.warning(f"LLM API stream failed (attempt {attempt + 1}/{attempts}): {error}; retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        raise LLMError("LLM API request failed")
+
+    async def acomplete(self, prompt: str, **kwargs: Any) -> str:
+        """发送一条用户提示，返回消息内容"""
+        result = await self.achat([{"role": "user", "content": prompt}], **kwargs)
+        return result["choices"][0]["message"]["content"]
+
+    def chat(self, messages: List[Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        """achat 的同步接口"""
+        return run_sync(self.achat(messages, **kwargs))
+
+    def complete(self, prompt: str, **kwargs: Any) -> str:
+        """acomplete 的同步接口"""
+        return run_sync(self.acomplete(prompt, **kwargs))
+
+    async def aclose(self):
+        """关闭当前事件循环的连接池"""
+        loop = asyncio.get_running_loop()
+        state = self._loop_state.pop(loop, None)
+        if state is not None:
+            await state["http"].aclose()
+
+
+_clients: Dict[Any, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(**overrides: Any) -> LLMClient:
+    """返回当前 BASE_URL / API_KEY / 模型配置对应的共享客户端"""
+    key = (
+        os.getenv("BASE_URL"),
+        os.getenv("API_KEY"),
+        os.getenv("model_name"),
+        tuple(sorted(overrides.items())),
+    )
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = LLMClient(**overrides)
+        return client
+
+
+# 同步调用共享一个后台事件循环，长连接在调用之间得以保留
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_lock = threading.Lock()
+
+
+def _get_sync_loop() -> asyncio.AbstractEventLoop:
+    global _sync_loop
+    with _sync_lock:
+        if _sync_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+            _sync_loop = loop
+            atexit.register(shutdown)
+    return _sync_loop
+
+
+async def _in_context(coro, context: contextvars.Context):
+    # 后台事件循环不会继承调用方的上下文，这里复制过去，
+    # 使上下文变量（如当前追踪 span）跨线程后依然有效
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+def run_sync(coro):
+    """在后台事件循环中运行协程并等待结果"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        context = contextvars.copy_context()
+        return asyncio.run_coroutine_threadsafe(_in_context(coro, context), _get_sync_loop()).result()
+    coro.close()
+    raise RuntimeError("Cannot use the sync LLM facade inside a running event loop, await the async API instead")
+
+
+def shutdown(timeout: float = 5.0):
+    """关闭后台事件循环中的连接池并停止该循环"""
+    global _sync_loop
+    with _sync_lock:
+        loop, _sync_loop = _sync_loop, None
+    if loop is None:
+        return
+
+    async def _close():
+        for client in list(_clients.values()):
+            await client.aclose()
+
+    try:
+        asyncio.run_coroutine_threadsafe(_close(), loop).result(timeout)
+    except Exception as e:
+        logger.error(f"Error closing LLM client: {e}")
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
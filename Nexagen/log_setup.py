@@ -0,0 +1,151 @@
+"""
+Nexagen 日志 - 生成的运行时使用的非阻塞、可轮转、可采样的日志
+
+`nexagen build` 将本模块原样复制到生成的项目中。协调器、MCP 客户端、pipeline 与
+MCP 服务器调用 setup_logging() 而不是 logging.basicConfig()：请求路径上的日志调用
+只把记录放入队列，由后台 QueueListener 线程写入可轮转的 orchestrator.log（以及
+NEXAGEN_LOG_CONSOLE_LEVEL 及以上级别写入 stderr；stdout 承载 stdio MCP 协议，不写入）。
+
+以 extra=PAYLOAD 记录的日志（提示词、LLM 响应、工具参数）会被采样：每秒最多
+NEXAGEN_LOG_PAYLOAD_RATE 条，每条以 NEXAGEN_LOG_PAYLOAD_SAMPLE 的概率保留。被丢弃的
+记录数附加在下一条通过的记录后面。
+
+setup_logging() 运行时从环境变量读取配置，调用方需先加载 .env：
+
+    NEXAGEN_LOG_LEVEL=INFO           orchestrator.log 的根日志级别
+    NEXAGEN_LOG_CONSOLE_LEVEL=WARNING
+    NEXAGEN_LOG_FILE=                默认 <项目目录>/orchestrator.log
+    NEXAGEN_LOG_MAX_MB=10            按大小轮转……
+    NEXAGEN_LOG_ROTATE_WHEN=         ……设置时按时间轮转（"midnight"、"H"）
+    NEXAGEN_LOG_BACKUPS=5
+    NEXAGEN_LOG_QUEUE_SIZE=10000     超出的记录直接丢弃，不会阻塞
+    NEXAGEN_LOG_PAYLOAD_RATE=20      每秒的 payload 记录数，0 表示不限
+    NEXAGEN_LOG_PAYLOAD_SAMPLE=1.0
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# 作为 extra= 传入，把记录标记为需要采样的大段 payload 日志
+PAYLOAD = {"payload": True}
+
+
+class PayloadSampler(logging.Filter):
+    """对标记为 extra=PAYLOAD 的记录按令牌桶加概率采样"""
+
+    def __init__(self, rate: float = 20.0, sample: float = 1.0):
+        super().__init__()
+        self.rate = rate
+        self.sample = sample
+        self.dropped = 0
+        self._tokens = max(rate, 1.0)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "payload", False):
+            return True
+        with self._lock:
+            if self.rate > 0:
+                now = time.monotonic()
+                self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._last) * self.rate)
+                self._last = now
+            keep = (self.rate <= 0 or self._tokens >= 1.0) and (self.sample >= 1.0 or random.random() < self.sample)
+            if not keep:
+                self.dropped += 1
+                return False
+            if self.rate > 0:
+                self._tokens -= 1.0
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} payload records sampled out)"
+            record.args = None
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """写入线程跟不上时丢弃记录，而不是阻塞调用方"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[_NonBlockingQueueHandler] = None
+_setup_lock = threading.Lock()
+
+
+def _file_handler(path: str, max_bytes: int, backups: int, when: str) -> logging.Handler:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backups, encoding="utf-8")
+    return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+
+
+def setup_logging():
+    """让根日志器经队列交给后台线程写入；可重复调用"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+        log_file = os.getenv("NEXAGEN_LOG_FILE") or str(Path(__file__).parent / "orchestrator.log")
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = []
+        try:
+            handlers.append(_file_handler(
+                log_file,
+                int(float(os.getenv("NEXAGEN_LOG_MAX_MB", "10")) * 1024 * 1024),
+                int(os.getenv("NEXAGEN_LOG_BACKUPS", "5")),
+                os.getenv("NEXAGEN_LOG_ROTATE_WHEN", ""),
+            ))
+        except (OSError, ValueError) as e:
+            print(f"Cannot open log file {log_file}: {e}", file=sys.stderr)
+        console = logging.StreamHandler(sys.stderr)
+        console.setLevel(os.getenv("NEXAGEN_LOG_CONSOLE_LEVEL", "WARNING").upper())
+        handlers.append(console)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        queue_handler = _NonBlockingQueueHandler(queue.Queue(int(os.getenv("NEXAGEN_LOG_QUEUE_SIZE", "10000"))))
+        queue_handler.addFilter(PayloadSampler(
+            float(os.getenv("NEXAGEN_LOG_PAYLOAD_RATE", "20")),
+            float(os.getenv("NEXAGEN_LOG_PAYLOAD_SAMPLE", "1.0")),
+        ))
+        root = logging.getLogger()
+        root.setLevel(os.getenv("NEXAGEN_LOG_LEVEL", "INFO").upper())
+        root.addHandler(queue_handler)
+        _queue_handler = queue_handler
+
+        _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """写出队列中的记录并停止后台写入线程"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        if _queue_handler.dropped:
+            print(f"{_queue_handler.dropped} log records dropped, the log queue was full", file=sys.stderr)
+        _listener = _queue_handler = None
@@ -68,3 +68,23 @@ This prompt ensures that MCP tools are correctly mapped to the skills in the Nex
 #mcp_cards.json content
 """
 
+
+generate_agent_descriptions_prompt="""# Objective
+Write a short description for each MCP agent listed below, based on the tools it exposes.
+
+# Input Format
+A JSON object mapping each agent name to its tools, each tool given as its name and the first line of its description.
+
+# Output Format
+Return a JSON object mapping every agent name from the input to a one-sentence description (at most 30 words) of the agent's purpose, written so an orchestrator can decide which agent should handle a task.
+**Do not return anything other than JSON.**
+
+# Example Output
+```json
+{
+  "chart": "Draws line, bar and pie charts from data arrays and returns the image file path"
+}
+```
+
+#agents
+"""
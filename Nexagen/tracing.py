@@ -0,0 +1,345 @@
+"""
+Nexagen 追踪 - 轻量级 span、JSONL 追踪导出与延迟分位数
+
+本模块只依赖标准库。`nexagen build` 将其原样复制到生成的项目中，协调器、pipeline、
+MCP 服务器与 MCP 客户端用 span 包裹每个阶段；`nexagen stats` 读回导出的追踪并汇总。
+
+每个结束的 span 以一个 JSON 对象追加到 `.nexagen/traces.jsonl`：trace_id、span_id、
+parent_id、name、start（epoch 秒）、duration_ms、status（"ok" / "error"）、error，
+以及 span 上设置的属性（agent、tool、prompt_tokens、completion_tokens 等）。
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("NEXAGEN_TRACING", "1").lower() not in ("0", "false", "no")
+# 追踪文件超过该大小后轮转为 traces.jsonl.1
+TRACE_MAX_BYTES = int(float(os.getenv("NEXAGEN_TRACE_MAX_MB", "50")) * 1024 * 1024)
+# 在内存中保留的最近 span 数，供 metrics_text() 使用
+RECENT_SPANS = int(os.getenv("NEXAGEN_TRACE_RECENT_SPANS", "10000"))
+
+QUANTILES = (0.5, 0.95, 0.99)
+# 汇总时作为标签的属性；其余属性只导出
+LABEL_ATTRS = ("agent", "tool")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("nexagen_span", default=None)
+
+
+def default_trace_path() -> Path:
+    path = os.getenv("NEXAGEN_TRACE_PATH")
+    if path:
+        return Path(path)
+    return Path(__file__).parent / ".nexagen" / "traces.jsonl"
+
+
+class Span:
+    """一段计时的工作；结束前可以添加属性"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attrs", "start", "_t0", "status", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(8)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, **attrs: Any):
+        self.attrs.update(attrs)
+
+    def to_record(self, duration: float) -> Dict[str, Any]:
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "status": self.status,
+        }
+        if self.error:
+            record["error"] = self.error
+        for key, value in self.attrs.items():
+            record.setdefault(key, value if isinstance(value, (str, int, float, bool)) or value is None else str(value))
+        return record
+
+
+class _NoopSpan:
+    trace_id = span_id = parent_id = None
+
+    def set(self, **attrs: Any):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class TraceExporter:
+    """把 span 记录追加到 JSONL 文件，并在内存中保留最近的记录"""
+
+    def __init__(self, path: Optional[Path] = None, max_bytes: int = TRACE_MAX_BYTES, recent: int = RECENT_SPANS):
+        self.path = Path(path) if path else default_trace_path()
+        self.max_bytes = max_bytes
+        self.recent: deque = deque(maxlen=recent)
+        self._lock = threading.Lock()
+        self._fh = None
+        self._failed = False
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.path, "a", encoding="utf-8")
+
+    def export(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.recent.append(record)
+            if self._failed:
+                return
+            try:
+                if self._fh is None:
+                    self._open()
+                self._fh.write(line)
+                self._fh.flush()
+                if self.max_bytes > 0 and self._fh.tell() > self.max_bytes:
+                    self._fh.close()
+                    os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+                    self._open()
+            except OSError as e:
+                logger.error(f"Trace export disabled, cannot write {self.path}: {e}")
+                self._failed = True
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+_exporter: Optional[TraceExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter() -> TraceExporter:
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = TraceExporter()
+    return _exporter
+
+
+def current_span():
+    """返回最内层未结束的 span；不在追踪中时返回空操作 span"""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def annotate(**attrs: Any):
+    """为最内层未结束的 span 添加属性"""
+    current_span().set(**attrs)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Any]:
+    """作为当前 span 的子 span，为一段同步或异步代码计时"""
+    if not TRACING_ENABLED:
+        yield _NOOP_SPAN
+        return
+    s = Span(name, _current_span.get(), attrs)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.status = "error"
+        s.error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        _current_span.reset(token)
+        get_exporter().export(s.to_record(time.perf_counter() - s._t0))
+
+
+def traced(name: str):
+    """span() 的装饰器形式，适用于普通函数与协程函数"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StartupProfile:
+    """导入与初始化各步骤的耗时，由 --profile-startup 打印"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps: List[tuple] = []
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - t0))
+
+    def render(self) -> str:
+        width = max([len(name) for name, _ in self.steps] + [9])
+        lines = [f"{'component':<{width}}  {'ms':>9}"]
+        for name, seconds in self.steps:
+            lines.append(f"{name:<{width}}  {seconds * 1000:>9.1f}")
+        total = time.perf_counter() - self.started
+        lines.append(f"{'total':<{width}}  {total * 1000:>9.1f}")
+        return "\n".join(lines)
+
+
+def load_traces(path: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """从追踪文件及其轮转出的旧文件读取 span 记录，按从旧到新排列"""
+    path = Path(path) if path else default_trace_path()
+    records = []
+    for candidate in (path.with_name(path.name + ".1"), path):
+        if not candidate.exists():
+            continue
+        with open(candidate, "r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """已排序列表的最近秩分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def aggregate(records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """按阶段以及阶段/Agent/工具汇总 span 记录
+
+    返回 {"stages": [...], "llm_tokens": {...}, "traces": n}，每个阶段行包含 name、
+    labels、count、errors、sum_ms 以及 p50/p95/p99 延迟。
+    """
+    durations: Dict[tuple, List[float]] = defaultdict(list)
+    errors: Dict[tuple, int] = defaultdict(int)
+    tokens = {"prompt": 0, "completion": 0}
+    traces = set()
+    for record in records:
+        name = record.get("name")
+        if not name:
+            continue
+        traces.add(record.get("trace_id"))
+        labels = tuple((attr, str(record[attr])) for attr in LABEL_ATTRS if record.get(attr) not in (None, ""))
+        keys = [(name, ())]
+        if labels:
+            keys.append((name, labels))
+        for key in keys:
+            durations[key].append(float(record.get("duration_ms", 0.0)))
+            if record.get("status") == "error":
+                errors[key] += 1
+        tokens["prompt"] += int(record.get("prompt_tokens") or 0)
+        tokens["completion"] += int(record.get("completion_tokens") or 0)
+
+    stages = []
+    for (name, labels), values in sorted(durations.items()):
+        values.sort()
+        row = {
+            "name": name,
+            "labels": dict(labels),
+            "count": len(values),
+            "errors": errors[(name, labels)],
+            "sum_ms": round(sum(values), 3),
+        }
+        for q in QUANTILES:
+            row[f"p{int(q * 100)}_ms"] = round(percentile(values, q), 3)
+        stages.append(row)
+    return {"stages": stages, "llm_tokens": tokens, "traces": len(traces)}
+
+
+def _label_str(labels: Dict[str, str]) -> str:
+    escaped = {k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for k, v in labels.items()}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped.items()) + "}"
+
+
+def render_prometheus(summary: Dict[str, Any]) -> str:
+    """把 aggregate() 的汇总渲染为 Prometheus 文本格式"""
+    lines = [
+        "# HELP nexagen_stage_duration_seconds Latency of orchestration stages, LLM calls and MCP calls",
+        "# TYPE nexagen_stage_duration_seconds summary",
+    ]
+    for row in summary["stages"]:
+        labels = {"stage": row["name"], **row["labels"]}
+        for q in QUANTILES:
+            value = row[f"p{int(q * 100)}_ms"] / 1000
+            lines.append(f"nexagen_stage_duration_seconds{_label_str({**labels, 'quantile': str(q)})} {value:.6f}")
+        lines.append(f"nexagen_stage_duration_seconds_sum{_label_str(labels)} {row['sum_ms'] / 1000:.6f}")
+        lines.append(f"nexagen_stage_duration_seconds_count{_label_str(labels)} {row['count']}")
+    lines += [
+        "# HELP nexagen_stage_errors_total Spans that ended with an exception",
+        "# TYPE nexagen_stage_errors_total counter",
+    ]
+    for row in summary["stages"]:
+        lines.append(f"nexagen_stage_errors_total{_label_str({'stage': row['name'], **row['labels']})} {row['errors']}")
+    lines += [
+        "# HELP nexagen_llm_tokens_total LLM tokens reported by the API usage field",
+        "# TYPE nexagen_llm_tokens_total counter",
+        f'nexagen_llm_tokens_total{{type="prompt"}} {summary["llm_tokens"]["prompt"]}',
+        f'nexagen_llm_tokens_total{{type="completion"}} {summary["llm_tokens"]["completion"]}',
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def render_table(summary: Dict[str, Any]) -> str:
+    """把 aggregate() 的汇总渲染为纯文本表格"""
+    rows = []
+    for row in summary["stages"]:
+        label = row["name"]
+        if row["labels"]:
+            label += " [" + ", ".join(f"{k}={v}" for k, v in row["labels"].items()) + "]"
+        rows.append((label, row))
+    width = max([len(label) for label, _ in rows] + [5])
+    lines = [
+        f"{'stage':<{width}}  {'count':>6}  {'errors':>6}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}"
+    ]
+    for label, row in rows:
+        lines.append(
+            f"{label:<{width}}  {row['count']:>6}  {row['errors']:>6}  "
+            f"{row['p50_ms']:>9.1f}  {row['p95_ms']:>9.1f}  {row['p99_ms']:>9.1f}"
+        )
+    tokens = summary["llm_tokens"]
+    lines.append(
+        f"{summary['traces']} traces, LLM tokens: {tokens['prompt']} prompt / {tokens['completion']} completion"
+    )
+    return "\n".join(lines)
+
+
+def metrics_text() -> str:
+    """本进程记录的 span 的 Prometheus 快照"""
+    return render_prometheus(aggregate(list(get_exporter().recent)))
@@ -7,42 +7,37 @@ from mcp.client.stdio import stdio_client
 from pathlib import Path
 from typing import List, Dict, Any
 import os
-import requests
 import json
+import hashlib
 from dotenv import load_dotenv
+from .llm_client import get_client
 
 load_dotenv(dotenv_path=".env")
 
 
 def call_llm(task_description: str) -> dict:
-    """使用LLM"""
-    api_key = os.getenv("API_KEY")
-    base_url = os.getenv("BASE_URL")
-
+    """使用LLM（共享连接池，自动限流与退避重试）"""
     prompt = task_description
 
-    headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+    return get_client().complete(
+        prompt,
+        temperature=0.3,
+        max_tokens=8000,
+        timeout=600
+    )
+
+
+async def async_call_llm(task_description: str, client=None) -> str:
+    """异步使用LLM，可传入带有独立并发/限流设置的 client"""
+    client = client or get_client()
+    return await client.acomplete(
+        task_description,
+        temperature=0.3,
+        max_tokens=8000,
+        timeout=600
+    )
 
-    payload = {
-            "model": os.getenv("model_name"),
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "max_tokens": 8000
-        }
 
-    response = requests.post(
-                f"{base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=600
-            )
-    #print(response.text)
-    result = response.json()
-    #print(result['choices'][0]['message']['content'])
-    return result['choices'][0]['message']['content']
 def generate_agent_card(
         name: str,
         description: str,
@@ -65,3 +60,109 @@ def generate_agent_card(
 
         }
 
+
+SCHEMA_CARD_VERSION = 1
+SKILL_TAG_LIMIT = 12
+_TAG_STOPWORDS = {"a", "an", "the", "of", "for", "to", "and", "or", "in", "on", "by", "with", "get", "set"}
+
+
+def _tag_words(text: str) -> List[str]:
+    """把 snake_case / kebab-case / camelCase 名称拆成小写单词"""
+    words = []
+    for part in re.split(r"[^A-Za-z0-9]+", str(text or "")):
+        words.extend(w.lower() for w in re.findall(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+", part))
+    return words
+
+
+def derive_skill_tags(tool: Dict) -> List[str]:
+    """根据工具名与输入 schema 的属性名生成标签（去重、保持顺序）"""
+    schema = tool.get("input_schema", {}) or {}
+    candidates = _tag_words(tool.get("name", ""))
+    for prop in (schema.get("properties", {}) or {}):
+        candidates.extend(_tag_words(prop))
+    tags = []
+    for word in candidates:
+        if len(word) > 1 and not word.isdigit() and word not in _TAG_STOPWORDS and word not in tags:
+            tags.append(word)
+    return tags[:SKILL_TAG_LIMIT]
+
+
+def default_agent_description(agent_name: str, agent_data: Dict) -> str:
+    """不调用 LLM 时的 agent 描述：拼接各工具描述的首行"""
+    lines = []
+    for tool in agent_data.get("tools", []):
+        line = str(tool.get("description") or "").strip().split("\n")[0].strip().rstrip(".")
+        lines.append(line or tool.get("name", ""))
+    if not lines:
+        return f"{agent_name} agent"
+    description = "; ".join(lines)
+    return description if len(description) <= 300 else description[:297] + "..."
+
+
+def schema_agent_card(agent_name: str, agent_data: Dict, description: str = None) -> Dict:
+    """直接由 mcp_cards 中的工具定义生成卡片，每个工具对应一个 skill"""
+    skills = [
+        {
+            "id": tool.get("name", ""),
+            "name": tool.get("name", ""),
+            "description": tool.get("description") or "",
+            "tags": derive_skill_tags(tool),
+            "examples": []
+        }
+        for tool in agent_data.get("tools", [])
+    ]
+    return generate_agent_card(
+        name=agent_name,
+        description=description or default_agent_description(agent_name, agent_data),
+        tools=skills,
+        url="http://localhost:0000/",
+        capabilities={
+            "streaming": False,
+            "pushNotifications": False,
+            "stateTransitionHistory": False
+        },
+        default_input_modes=["text", "text/plain"],
+        default_output_modes=["text", "text/plain"]
+    )
+
+
+BUILD_MANIFEST_VERSION = 1
+
+
+def agent_content_hash(server_config: Dict, mcp_card: Dict, generator: str = "") -> str:
+    """计算单个 agent 的内容哈希：mcp.json 配置 + 发现的工具及输入 schema + 卡片生成方式"""
+    payload = json.dumps(
+        {"server": server_config, "mcp_card": mcp_card, "generator": generator},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def agent_schema_hash(server_config: Dict, mcp_card: Dict) -> str:
+    """计算单个 agent 的 schema 哈希：mcp.json 配置 + 发现的工具及输入 schema（不含卡片生成方式）
+
+    运行时的工具结果缓存以此判断 agent 是否变化。
+    """
+    return agent_content_hash(server_config, mcp_card)
+
+
+def load_build_manifest(manifest_path: Path) -> Dict:
+    """读取构建清单，不存在或格式不符时返回空清单"""
+    try:
+        manifest = json.loads(Path(manifest_path).read_text(encoding="utf-8"))
+        if manifest.get("version") == BUILD_MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": BUILD_MANIFEST_VERSION, "agents": {}}
+
+
+def save_build_manifest(manifest_path: Path, manifest: Dict):
+    """写入构建清单（按 agent 名排序，保证输出稳定）"""
+    manifest = {
+        "version": BUILD_MANIFEST_VERSION,
+        **{key: value for key, value in manifest.items() if key != "version"},
+        "agents": dict(sorted(manifest.get("agents", {}).items()))
+    }
+    Path(manifest_path).write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
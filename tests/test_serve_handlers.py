@@ -0,0 +1,93 @@
+"""
+nexagen serve 的任务处理函数：工具调用失败的任务必须报告为失败
+"""
+import asyncio
+import importlib
+import json
+import shutil
+import sys
+import types
+from pathlib import Path
+
+import pytest
+from jinja2 import Environment, FileSystemLoader
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / "Nexagen"
+RUNTIME_MODULES = ("serve", "agent_health", "result_store", "tracing", "mcp_server", "pipeline")
+
+
+@pytest.fixture
+def runtime(tmp_path, monkeypatch):
+    """把 serve 及其依赖的运行时模块生成到临时目录并导入"""
+    env = Environment(loader=FileSystemLoader(str(PACKAGE_DIR / "templates")))
+    for name in ("serve", "agent_health", "result_store"):
+        (tmp_path / f"{name}.py").write_text(env.get_template(f"{name}.py.j2").render(), encoding="utf-8")
+    shutil.copy(PACKAGE_DIR / "tracing.py", tmp_path / "tracing.py")
+    monkeypatch.setenv("NEXAGEN_TRACING", "0")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in RUNTIME_MODULES:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    modules = types.SimpleNamespace(
+        serve=importlib.import_module("serve"),
+        agent_health=importlib.import_module("agent_health"),
+        result_store=importlib.import_module("result_store"),
+    )
+    yield modules
+    for name in RUNTIME_MODULES:
+        sys.modules.pop(name, None)
+
+
+def _fake_module(monkeypatch, name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    monkeypatch.setitem(sys.modules, name, module)
+
+
+def test_route_reports_failed_tool_call(runtime, monkeypatch):
+    agent_health = runtime.agent_health
+    failure = agent_health.ToolCallError("timeout", "Tool draw timed out after 60 seconds", "chart", "draw",
+                                         retryable=True)
+
+    async def nexagen_route(task_description):
+        # 与 mcp_server.nexagen_route 相同的输出格式：失败的子任务带 ok=False 与结构化 error
+        items = [
+            {"task": "查询", "agent": "search", "tool": "query", "ok": True, "result": "3 rows"},
+            {"task": "画图", "agent": "chart", "tool": "draw", "ok": False, "result": str(failure),
+             "error": agent_health.error_info(failure)},
+        ]
+        return json.dumps(items, ensure_ascii=False)
+
+    _fake_module(monkeypatch, "mcp_server", nexagen_route=nexagen_route)
+    outcome = asyncio.run(runtime.serve._run_route("画出销售数据"))
+
+    assert outcome["ok"] is False
+    assert outcome["error"]["kind"] == "timeout"
+    assert outcome["error"]["retryable"] is True
+    assert len(outcome["result"]) == 2
+
+
+def test_route_reports_success(runtime, monkeypatch):
+    async def nexagen_route(task_description):
+        return json.dumps([{"task": "查询", "agent": "search", "tool": "query", "ok": True, "result": "3 rows"}])
+
+    _fake_module(monkeypatch, "mcp_server", nexagen_route=nexagen_route)
+    outcome = asyncio.run(runtime.serve._run_route("查询"))
+
+    assert outcome == {"ok": True, "result": [{"task": "查询", "agent": "search", "tool": "query",
+                                                "ok": True, "result": "3 rows"}], "error": None}
+
+
+def test_pipeline_reports_is_error_tool_result(runtime, monkeypatch):
+    # isError 结果的文本是工具自己的输出，不以 "Error" 开头
+    failed = runtime.result_store.ToolResult([{"type": "text", "text": "quota exceeded"}], is_error=True)
+
+    async def agent_pipeline_async(task, concurrency=None, planner=None):
+        return ["3 rows", failed]
+
+    _fake_module(monkeypatch, "pipeline", agent_pipeline_async=agent_pipeline_async)
+    outcome = asyncio.run(runtime.serve._run_pipeline("查询并画图"))
+
+    assert outcome["ok"] is False
+    assert outcome["result"] == ["3 rows", "quota exceeded"]
+    assert outcome["error"]["kind"] == "tool_error"
+    assert outcome["error"]["message"] == "quota exceeded"